@@ -0,0 +1,2 @@
+"""Benchmarks for srs. Run with ``python -m bench.run --help`` from the
+top level of the repo."""
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""Run benchmarks for each subsystem of srs, and save/compare results.
+
+Each benchmark runs in its own (forked) process, so that peak memory
+is measured per subsystem. Results are written as JSON, and can be
+compared with an earlier run using --compare.
+
+Example:
+
+    python -m bench.run -o before.json
+    (make changes)
+    python -m bench.run -o after.json --compare before.json
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import platform
+import resource
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+from multiprocessing import Process
+from multiprocessing import Queue
+from os import chdir
+from os import devnull
+from os import getcwd
+from shutil import rmtree
+from subprocess import check_output
+from tempfile import mkdtemp
+from time import time
+
+from srs.claim import claim_to_judgment
+from srs.db import normalize_ratings
+from srs.db import open_db
+from srs.harness import add_record
+from srs.harness import run_scrapers
+from srs.harness import save_records_from_scraper
+from srs.log import log_to_stderr
+from srs.norm import clean_string
+from srs.stats import get_stats
+from srs.scrape import scrape_soup
+from srs.vendor.reppy.parser import Rules
+
+from .server import start_server
+from .synthetic import CLAIMS
+from .synthetic import generate_records
+from .synthetic import write_scraper_package
+
+log = logging.getLogger('bench.run')
+
+SCRAPERS_PACKAGE = 'bench_scrapers'
+
+
+def bench_clean_string(opts):
+    strings = [u'  Brand {}’s   thing  '.format(i)
+               for i in xrange(opts.num_items)]
+
+    start = time()
+    for s in strings:
+        clean_string(s)
+    return len(strings), time() - start
+
+
+def bench_claim_to_judgment(opts):
+    claims = [CLAIMS[i % len(CLAIMS)] for i in xrange(opts.num_items)]
+
+    start = time()
+    for claim in claims:
+        claim_to_judgment(claim)
+    return len(claims), time() - start
+
+
+def bench_robots_parser(opts):
+    robots_txt = ''.join(
+        'User-agent: bot{0}\nDisallow: /private/{0}/\nAllow: /public/{0}\n'
+        'Crawl-delay: 1\n\n'.format(i) for i in xrange(100))
+    robots_txt += 'User-agent: *\nDisallow: /private/\n'
+    num_parses = max(opts.num_items // 1000, 1)
+
+    start = time()
+    for i in xrange(num_parses):
+        rules = Rules('http://example.com/robots.txt', 200, robots_txt, 0)
+        for j in xrange(100):
+            rules.allowed('http://example.com/private/{}/'.format(j), 'Bot')
+    return num_parses, time() - start
+
+
+def bench_scrape(opts, base_url):
+    start = time()
+    for page in xrange(opts.num_pages):
+        scrape_soup(base_url + 'page/{}'.format(page))
+    return opts.num_pages, time() - start
+
+
+def bench_add_record(opts):
+    records = list(generate_records(num_companies=opts.num_companies))
+    table_to_key_to_row = {}
+
+    start = time()
+    for table, record in records:
+        add_record(table, record, table_to_key_to_row)
+    return len(records), time() - start
+
+
+def bench_save_records_from_scraper(opts):
+    records = list(generate_records(num_companies=opts.num_companies))
+
+    start = time()
+    save_records_from_scraper(records, 'bench')
+    return len(records), time() - start
+
+
+def bench_normalize_ratings(opts):
+    records = list(generate_records(num_companies=opts.num_companies))
+    save_records_from_scraper(records, 'bench')
+    db = open_db()
+    num_ratings = list(db.execute('SELECT COUNT(*) FROM rating'))[0][0]
+
+    start = time()
+    normalize_ratings(db=db)
+    return num_ratings, time() - start
+
+
+def bench_run_scrapers(opts, base_url):
+    scraper_ids = write_scraper_package(
+        '.', SCRAPERS_PACKAGE, opts.num_scrapers, base_url,
+        num_pages=opts.num_pages, num_companies=opts.num_companies)
+    sys.path.insert(0, getcwd())
+
+    start = time()
+    run_scrapers(lambda scraper: scraper.scrape_campaign(),
+                 scraper_ids=scraper_ids, package=SCRAPERS_PACKAGE)
+    return len(scraper_ids), time() - start
+
+
+# (name, function, whether it needs the HTTP server's URL)
+BENCHMARKS = [
+    ('clean_string', bench_clean_string, False),
+    ('claim_to_judgment', bench_claim_to_judgment, False),
+    ('robots_parser', bench_robots_parser, False),
+    ('scrape', bench_scrape, True),
+    ('add_record', bench_add_record, False),
+    ('save_records_from_scraper', bench_save_records_from_scraper, False),
+    ('normalize_ratings', bench_normalize_ratings, False),
+    ('run_scrapers', bench_run_scrapers, True),
+]
+
+
+def _run_in_child(func, args, queue):
+    """Run a benchmark in a scratch directory, and put its results
+    on queue."""
+    tmp_dir = mkdtemp(prefix='srs-bench-')
+    chdir(tmp_dir)
+    try:
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        num_items, secs = func(*args)
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        queue.put(dict(
+            items=num_items,
+            secs=secs,
+            items_per_sec=(num_items / secs if secs else None),
+            peak_rss_kb=peak_rss,
+            rss_growth_kb=peak_rss - start_rss,
+            stats=get_stats(),
+        ))
+    except:
+        log.exception('benchmark failed')
+        queue.put(None)
+    finally:
+        rmtree(tmp_dir, ignore_errors=True)
+
+
+def run_benchmarks(opts):
+    """Run the benchmarks selected by opts, return a map from name
+    to results."""
+    server, base_url = start_server(num_items=opts.items_per_page)
+    results = {}
+
+    try:
+        for name, func, needs_url in BENCHMARKS:
+            if opts.only and name not in opts.only:
+                continue
+
+            log.info('Running benchmark: {}'.format(name))
+            args = (opts, base_url) if needs_url else (opts,)
+
+            queue = Queue()
+            child = Process(target=_run_in_child, args=(func, args, queue))
+            child.start()
+            result = queue.get()
+            child.join()
+
+            if result is None:
+                log.error('Benchmark failed: {}'.format(name))
+                continue
+
+            log.info('{}: {:.3f} secs, {:.1f} items/sec, {} KB peak'.format(
+                name, result['secs'], result['items_per_sec'] or 0,
+                result['peak_rss_kb']))
+            results[name] = result
+    finally:
+        server.shutdown()
+
+    return results
+
+
+def get_git_rev():
+    try:
+        with open(devnull, 'w') as null:
+            return check_output(
+                ['git', 'rev-parse', 'HEAD'], stderr=null).strip()
+    except Exception:
+        return None
+
+
+def compare(results, old_results):
+    """Print a table comparing items/sec and peak memory with an
+    earlier run."""
+    print '{:<28}{:>12}{:>12}{:>9}{:>12}{:>12}'.format(
+        'benchmark', 'old/sec', 'new/sec', 'ratio', 'old KB', 'new KB')
+
+    for name in sorted(results):
+        new = results[name]
+        old = old_results.get(name)
+        if not old:
+            continue
+
+        ratio = None
+        if old['items_per_sec'] and new['items_per_sec']:
+            ratio = new['items_per_sec'] / old['items_per_sec']
+
+        print '{:<28}{:>12.1f}{:>12.1f}{:>9}{:>12}{:>12}'.format(
+            name, old['items_per_sec'] or 0, new['items_per_sec'] or 0,
+            '{:.2f}x'.format(ratio) if ratio else '-',
+            old['peak_rss_kb'], new['peak_rss_kb'])
+
+
+def main(args=None):
+    parser = ArgumentParser(description='Benchmark srs subsystems.')
+    parser.add_argument(
+        '-o', '--output', default=None,
+        help='Where to write results as JSON (default: bench-<time>.json)')
+    parser.add_argument(
+        '--compare', default=None, metavar='FILE',
+        help='Compare results with a JSON file from an earlier run')
+    parser.add_argument(
+        '--only', nargs='+', default=None, metavar='BENCHMARK',
+        choices=[name for name, _, _ in BENCHMARKS],
+        help='Only run the given benchmarks')
+    parser.add_argument(
+        '--num-items', type=int, default=100000,
+        help='Number of strings/claims for micro-benchmarks')
+    parser.add_argument(
+        '--num-companies', type=int, default=1000,
+        help='Number of companies in synthetic records (each has brands,'
+        ' categories, ratings, and claims)')
+    parser.add_argument(
+        '--num-pages', type=int, default=50,
+        help='Number of pages each synthetic scraper downloads')
+    parser.add_argument(
+        '--items-per-page', type=int, default=100,
+        help='Number of brands listed on each synthetic page')
+    parser.add_argument(
+        '--num-scrapers', type=int, default=3,
+        help='Number of synthetic scrapers for run_scrapers benchmark')
+    opts = parser.parse_args(args)
+
+    log_to_stderr()
+
+    results = run_benchmarks(opts)
+
+    output = opts.output or 'bench-{}.json'.format(
+        datetime.utcnow().strftime('%Y%m%dT%H%M%S'))
+    with open(output, 'w') as f:
+        json.dump(dict(
+            time=datetime.utcnow().isoformat(),
+            git_rev=get_git_rev(),
+            python=platform.python_version(),
+            options=vars(opts),
+            results=results,
+        ), f, indent=2, sort_keys=True)
+    log.info('Wrote results to {}'.format(output))
+
+    if opts.compare:
+        with open(opts.compare) as f:
+            compare(results, json.load(f)['results'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""A local HTTP server that stands in for the sites scrapers hit."""
+from __future__ import absolute_import
+
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
+
+DEFAULT_ROBOTS_TXT = 'User-agent: *\nDisallow: /private/\n'
+
+PAGE_TEMPLATE = u"""<!DOCTYPE html>
+<html>
+<head><title>Page {page}</title></head>
+<body>
+<ul>
+{items}
+</ul>
+<a href="https://twitter.com/share">Tweet</a>
+<a href="https://twitter.com/BenchCo{page}">@BenchCo{page}</a>
+<a href="http://www.facebook.com/benchco{page}">Facebook</a>
+<p>© 2014 Bench Co.</p>
+</body>
+</html>
+"""
+
+ITEM_TEMPLATE = u'<li><a href="/brand/{i}">Brand {i}™</a> (Company {i})</li>'
+
+
+def make_page(page, num_items=100):
+    """Make a page with a list of brands, social media links, and a
+    copyright notice, encoded as UTF-8."""
+    items = u'\n'.join(ITEM_TEMPLATE.format(i=i) for i in xrange(num_items))
+    return PAGE_TEMPLATE.format(page=page, items=items).encode('utf8')
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == '/robots.txt':
+            self._respond(self.server.robots_txt, 'text/plain')
+        else:
+            page = self.path.strip('/').split('/')[-1] or '0'
+            self._respond(
+                make_page(page, self.server.num_items), 'text/html')
+
+    def _respond(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # don't spam stderr with a line per request
+
+
+def start_server(robots_txt=DEFAULT_ROBOTS_TXT, num_items=100):
+    """Serve robots.txt and synthetic pages from a random port on
+    localhost, in a background thread.
+
+    Returns (server, base_url). Call server.shutdown() when done.
+    """
+    server = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    server.robots_txt = robots_txt
+    server.num_items = num_items
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    return server, 'http://127.0.0.1:{}/'.format(server.server_address[1])
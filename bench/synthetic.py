@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Synthetic records and scraper modules for benchmarking."""
+from __future__ import absolute_import
+
+import random
+from os import mkdir
+from os.path import join
+
+# deliberately messy, so that clean_string() etc. have work to do
+COMPANY_TEMPLATE = u'  Company {i}, Inc. '
+BRAND_TEMPLATE = u'Brand {i}’s {j}™'
+CATEGORY_TEMPLATE = u' Category  {i} '
+
+GRADES = ['A+', 'A', 'B', 'B-', 'C', 'D', 'F']
+
+CLAIMS = [
+    u'Company has a supplier code of conduct.',
+    u'Company does not disclose its supplier list.',
+    u'Some public information about audits, however it is incomplete.',
+    u'Minimal effort to address forced labor.',
+    u'Distinguished leadership on living wages.',
+]
+
+SCRAPER_TEMPLATE = '''"""Synthetic scraper generated by bench.synthetic."""
+from bench.synthetic import generate_records
+from srs.scrape import scrape_soup
+
+BASE_URL = {base_url!r}
+NUM_PAGES = {num_pages!r}
+RECORD_KWARGS = {record_kwargs!r}
+
+
+def scrape_campaign():
+    for page in range(NUM_PAGES):
+        scrape_soup(BASE_URL + 'page/{{}}'.format(page))
+
+    for record in generate_records(**RECORD_KWARGS):
+        yield record
+'''
+
+
+def generate_records(num_companies=100, brands_per_company=5,
+                     categories_per_brand=2, claims_per_company=3, seed=0):
+    """Yield (table, record) tuples like a campaign scraper would:
+    nested company/brand/category dicts, ratings, and claims."""
+    rand = random.Random(seed)
+
+    yield 'campaign', dict(
+        campaign='Synthetic Campaign', url='http://example.com/campaign')
+
+    for i in xrange(num_companies):
+        company = dict(company=COMPANY_TEMPLATE.format(i=i),
+                       url='http://example.com/company/{}'.format(i))
+
+        brands = []
+        for j in xrange(brands_per_company):
+            brands.append(dict(
+                brand=BRAND_TEMPLATE.format(i=i, j=j),
+                categories=[CATEGORY_TEMPLATE.format(i=rand.randrange(50))
+                            for _ in xrange(categories_per_brand)]))
+        company['brands'] = brands
+
+        yield 'company', company
+
+        yield 'rating', dict(
+            company=company['company'],
+            grade=rand.choice(GRADES),
+            score=rand.randint(0, 100),
+            max_score=100,
+            rank=i + 1,
+            num_ranked=num_companies,
+            url='http://example.com/rating/{}'.format(i))
+
+        for brand in brands:
+            yield 'rating', dict(
+                company=company['company'],
+                brand=brand['brand'],
+                grade=rand.choice(GRADES))
+
+        for _ in xrange(claims_per_company):
+            yield 'claim', dict(
+                company=company['company'],
+                claim=rand.choice(CLAIMS),
+                judgment=rand.choice([-1, 0, 1]))
+
+
+def write_scraper_package(parent_dir, package, num_scrapers, base_url,
+                          num_pages=10, **record_kwargs):
+    """Write a package of synthetic scraper modules (scraper_0, scraper_1,
+    etc.) into parent_dir, and return their scraper IDs.
+
+    Each scraper scrapes num_pages pages from base_url, and then yields
+    records from generate_records(**record_kwargs).
+    """
+    package_dir = join(parent_dir, package)
+    mkdir(package_dir)
+
+    with open(join(package_dir, '__init__.py'), 'w'):
+        pass
+
+    scraper_ids = []
+    for n in xrange(num_scrapers):
+        scraper_id = 'scraper_{}'.format(n)
+        kwargs = dict(record_kwargs, seed=n)
+
+        with open(join(package_dir, scraper_id + '.py'), 'w') as f:
+            f.write(SCRAPER_TEMPLATE.format(
+                base_url=base_url, num_pages=num_pages,
+                record_kwargs=kwargs))
+
+        scraper_ids.append(scraper_id)
+
+    return scraper_ids
@@ -0,0 +1,198 @@
+"""Checkpointing, so that a scraper that crashes partway through doesn't
+lose the work it's already done.
+
+When checkpointing is turned on (see checkpoint_every in run_scrapers()),
+the harness periodically flushes the records it's normalized so far to
+the scraper_staging table, along with the scraper's cursor. When the
+scraper finishes, the staged records are swapped in all at once.
+
+Scrapers opt in by recording how far they've gotten, for example:
+
+    from srs.checkpoint import get_cursor
+    from srs.checkpoint import set_cursor
+
+    def scrape_campaign():
+        start = get_cursor() or 0
+        for page in range(start, NUM_PAGES):
+            for record in scrape_page(page):
+                yield record
+            set_cursor(page + 1)
+
+The cursor can be anything that can be converted to JSON. Calling
+set_cursor() means that everything yielded so far needn't be yielded
+again if the scraper is resumed from that cursor.
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import sqlite3
+from cPickle import dumps
+from cPickle import loads
+
+from .db import open_db
+from .iso_8601 import iso_now
+from .norm import merge
+
+log = logging.getLogger(__name__)
+
+# these tables hold work in progress, not scraped data
+CHECKPOINT_TABLES = {
+    # where each scraper is, and how many batches it's staged
+    'scraper_checkpoint': (
+        'CREATE TABLE IF NOT EXISTS `scraper_checkpoint` ('
+        '`scraper_id` TEXT, `cursor` TEXT, `num_batches` INTEGER, '
+        '`last_checkpointed` TEXT, PRIMARY KEY (`scraper_id`))'),
+    # pickled (normalized) rows, in the form add_record() puts them
+    'scraper_staging': (
+        'CREATE TABLE IF NOT EXISTS `scraper_staging` ('
+        '`scraper_id` TEXT, `batch` INTEGER, `table_name` TEXT, '
+        '`key` BLOB, `row` BLOB)'),
+}
+
+# the scraper currently running, and its cursor
+_checkpoint = {}
+
+
+def get_cursor():
+    """Get the cursor for the scraper currently running, or None if
+    the scraper is starting from scratch (or checkpointing is off)."""
+    return _checkpoint.get('cursor')
+
+
+def set_cursor(cursor):
+    """Record how far the scraper currently running has gotten. This is
+    saved the next time the harness flushes records to the staging table.
+
+    Does nothing if checkpointing is off.
+    """
+    if 'scraper_id' in _checkpoint:
+        _checkpoint['cursor'] = cursor
+
+
+def reset_checkpoint():
+    """Forget about the scraper that was running (the harness calls this
+    before running a new scraper). Doesn't touch the db."""
+    _checkpoint.clear()
+
+
+def create_checkpoint_tables_if_not_exist(db=None):
+    if db is None:
+        db = open_db()
+
+    for sql in CHECKPOINT_TABLES.itervalues():
+        db.execute(sql)
+
+
+def load_checkpoint(scraper_id, db=None):
+    """Load the checkpoint (if any) for the given scraper, so that
+    get_cursor() will return its cursor.
+
+    If there's no checkpoint, or it has no cursor (so the scraper will
+    start from scratch), any staged records are discarded.
+    """
+    if db is None:
+        db = open_db()
+
+    create_checkpoint_tables_if_not_exist(db)
+
+    _checkpoint.clear()
+    _checkpoint['scraper_id'] = scraper_id
+    _checkpoint['num_batches'] = 0
+
+    rows = list(db.execute(
+        'SELECT cursor, num_batches, last_checkpointed'
+        ' FROM scraper_checkpoint WHERE scraper_id = ?', [scraper_id]))
+
+    # without a cursor, the scraper will yield everything again, and
+    # staged records it no longer yields would be swapped in too
+    if rows and rows[0][0] is not None:
+        cursor, num_batches, last_checkpointed = rows[0]
+        _checkpoint['cursor'] = json.loads(cursor)
+        _checkpoint['num_batches'] = num_batches
+        log.info('Resuming %s from checkpoint at %s (%d batches)',
+                 scraper_id, last_checkpointed, num_batches)
+    else:
+        clear_checkpoint(scraper_id, db=db)
+
+
+def is_checkpoint_loaded(scraper_id):
+    """Has load_checkpoint() been called for the given scraper?"""
+    return _checkpoint.get('scraper_id') == scraper_id
+
+
+def stage_records(scraper_id, table_to_key_to_row, db=None):
+    """Write a batch of normalized records (a map from
+    table -> key -> row, as made by add_record()) to the staging table,
+    along with the current cursor, in a single transaction."""
+    if db is None:
+        db = open_db()
+
+    if not is_checkpoint_loaded(scraper_id):
+        raise ValueError(
+            'must call load_checkpoint({!r}) first'.format(scraper_id))
+
+    batch = _checkpoint['num_batches']
+
+    db.rollback()
+    db.executemany(
+        'INSERT INTO scraper_staging (scraper_id, batch, table_name, key, row)'
+        ' VALUES (?, ?, ?, ?, ?)',
+        ((scraper_id, batch, table,
+          sqlite3.Binary(dumps(key, 2)), sqlite3.Binary(dumps(row, 2)))
+         for table, key_to_row in table_to_key_to_row.iteritems()
+         for key, row in key_to_row.iteritems()))
+
+    cursor = get_cursor()
+    db.execute(
+        'INSERT OR REPLACE INTO scraper_checkpoint'
+        ' (scraper_id, cursor, num_batches, last_checkpointed)'
+        ' VALUES (?, ?, ?, ?)',
+        [scraper_id, None if cursor is None else json.dumps(cursor),
+         batch + 1, iso_now()])
+    db.commit()
+
+    _checkpoint['num_batches'] = batch + 1
+
+
+def load_staged_records(scraper_id, table_to_key_to_row, db=None):
+    """Merge all staged records for the given scraper into
+    table_to_key_to_row, oldest batch first."""
+    if db is None:
+        db = open_db()
+
+    sql = ('SELECT table_name, key, row FROM scraper_staging'
+           ' WHERE scraper_id = ? ORDER BY batch')
+
+    for table, key, row in db.execute(sql, [scraper_id]):
+        key = loads(str(key))
+        row = loads(str(row))
+
+        key_to_row = table_to_key_to_row.setdefault(table, {})
+        if key in key_to_row:
+            merge(row, key_to_row[key])
+        else:
+            key_to_row[key] = row
+
+
+def clear_checkpoint(scraper_id, db=None, commit=True):
+    """Discard the checkpoint and staged records for the given scraper.
+
+    If commit is False, leave that to the caller (so that it can
+    be done in the same transaction as other changes).
+    """
+    if db is None:
+        db = open_db()
+
+    if commit:
+        db.rollback()
+    db.execute('DELETE FROM scraper_staging WHERE scraper_id = ?',
+               [scraper_id])
+    db.execute('DELETE FROM scraper_checkpoint WHERE scraper_id = ?',
+               [scraper_id])
+    if commit:
+        db.commit()
+
+    if is_checkpoint_loaded(scraper_id):
+        _checkpoint.pop('cursor', None)
+        _checkpoint['num_batches'] = 0
@@ -9,6 +9,7 @@ from urllib import urlencode
 import dumptruck
 from dumptruck import DumpTruck
 
+from .rating import DEFAULT_MIN_SCORE
 from .scrape import download
 
 log = logging.getLogger(__name__)
@@ -39,6 +40,8 @@ TABLE_TO_KEY_FIELDS = {
     'scraper_category_map': ['scraper_id', 'scraper_category'],
     # map from company from scraper to canonical version
     'scraper_company_map': ['scraper_id', 'scraper_company'],
+    # counters and timers from the last time a scraper ran (see srs.stats)
+    'scraper_stats': ['scraper_id', 'stat'],
     # which categories are subcategories of others
     'subcategory': ['category', 'subcategory'],
     # map from url to twitter handle, etc. found at that URL
@@ -61,6 +64,10 @@ _RATING_FIELDS = [
     ('num_ranked', 'INTEGER'),
     # url for details about the rating
     ('url', 'TEXT'),
+    # filled in by normalize_ratings(): judgment (from grade if
+    # need be), and score or rank scaled from 0 (worst) to 1 (best)
+    ('normalized_judgment', 'TINYINT'),
+    ('normalized_score', 'REAL'),
 ]
 
 TABLE_TO_EXTRA_FIELDS = {
@@ -71,6 +78,7 @@ TABLE_TO_EXTRA_FIELDS = {
     'campaign_company_rating': _RATING_FIELDS,
     'rating': _RATING_FIELDS,
     'scraper': [('last_scraped', 'TEXT')],
+    'scraper_stats': [('value', 'NUMERIC')],
     'subcategory': [('is_implied', 'TINYINT')],
 }
 
@@ -83,6 +91,29 @@ OBSOLETE_TABLES = {
     'company_category': 'category',
 }
 
+# tables that normalize_ratings() fills in
+RATING_TABLES = ['rating']
+
+# SQL equivalent of srs.rating.grade_to_judgment()
+GRADE_TO_JUDGMENT_SQL = """CASE
+    WHEN grade IS NULL OR grade = '' THEN NULL
+    WHEN UPPER(SUBSTR(grade, 1, 1)) < 'C' THEN 1
+    WHEN UPPER(SUBSTR(grade, 1, 1)) = 'C' THEN 0
+    ELSE -1 END"""
+
+# scale score to 0-1 using min_score and max_score, or else rank to 0-1
+# using num_ranked (rank 1 is best)
+NORMALIZED_SCORE_SQL = """CASE
+    WHEN score IS NOT NULL AND max_score IS NOT NULL
+        AND max_score != COALESCE(min_score, :min_score)
+    THEN (score - COALESCE(min_score, :min_score)) * 1.0 /
+        (max_score - COALESCE(min_score, :min_score))
+    WHEN rank IS NOT NULL AND num_ranked > 1
+    THEN (num_ranked - rank) * 1.0 / (num_ranked - 1)
+    WHEN rank IS NOT NULL AND num_ranked = 1
+    THEN 1.0
+    ELSE NULL END"""
+
 
 
 def download_db(
@@ -100,16 +131,17 @@ def download_db(
             morph_project, prefix, db_name, urlencode(
                 {'key': environ['MORPH_API_KEY']}))
 
-        log.info('downloading {} -> {}'.format(url, db_path))
+        log.info('downloading %s -> %s', url, db_path)
         download(url, db_path)
 
 
-def open_db(db_name=DEFAULT_DB_NAME):
+def open_db(db_name=DEFAULT_DB_NAME, row_factory=sqlite3.Row):
     """Open the (local) sqlite database of the given name.
-    Use sqlite3.Row as our row_factory to wrap rows like dicts.
+    By default, use sqlite3.Row as our row_factory to wrap rows like dicts.
+    Set row_factory to None to get plain tuples (which is faster).
     """
     db = sqlite3.connect(get_db_path(db_name))
-    db.row_factory = sqlite3.Row
+    db.row_factory = row_factory
     return db
 
 
@@ -149,6 +181,32 @@ def create_table_if_not_exists(table,
     db.execute(sql)
 
 
+def add_columns_if_not_exist(table, fields, db=None):
+    """Add any columns that the given table doesn't have yet.
+
+    fields -- (column, type) pairs, like in TABLE_TO_EXTRA_FIELDS. Columns
+        may appear more than once; only the first type is used.
+    """
+    if db is None:
+        db = open_db()
+
+    # main, in case other dbs are ATTACHed
+    columns = set(row[1] for row in db.execute(
+        'PRAGMA main.table_info(`{}`)'.format(table)))
+
+    for k, field_type in fields:
+        if k not in columns:
+            db.execute('ALTER TABLE main.`{}` ADD COLUMN `{}` {}'.format(
+                table, k, field_type))
+            columns.add(k)
+
+
+def get_field_type(value):
+    """Choose a column type for the given value, the same way
+    dumptruck does."""
+    return dumptruck.PYTHON_SQLITE_TYPE_MAP.get(type(value), 'text')
+
+
 def use_decimal_type_in_sqlite():
     """Use Decimal type for reals in sqlite3. Not reversible."""
     dumptruck.PYTHON_SQLITE_TYPE_MAP.setdefault(Decimal, 'real')
@@ -159,3 +217,35 @@ def show_tables(db):
     """List the tables in the given db."""
     sql = "SELECT name FROM sqlite_master WHERE type = 'table'"
     return sorted(row[0] for row in db.execute(sql))
+
+
+def normalize_ratings(db=None):
+    """Fill in normalized_judgment and normalized_score for every row
+    in the rating table(s), in a single UPDATE per table.
+
+    normalized_judgment is judgment if set, and otherwise the judgment
+    implied by grade (see srs.rating.grade_to_judgment()).
+
+    normalized_score is from 0 (worst) to 1 (best), based on score
+    (relative to min_score and max_score) or, failing that, rank (relative
+    to num_ranked).
+    """
+    if db is None:
+        db = open_db()
+
+    for table in RATING_TABLES:
+        create_table_if_not_exists(table, db=db)
+        add_columns_if_not_exist(
+            table, TABLE_TO_EXTRA_FIELDS[table], db=db)
+
+    db.commit()
+
+    for table in RATING_TABLES:
+        db.execute(
+            'UPDATE `{}` SET'
+            ' normalized_judgment = COALESCE(judgment, {}),'
+            ' normalized_score = {}'.format(
+                table, GRADE_TO_JUDGMENT_SQL, NORMALIZED_SCORE_SQL),
+            dict(min_score=DEFAULT_MIN_SCORE))
+
+    db.commit()
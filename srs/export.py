@@ -0,0 +1,219 @@
+"""Export the scraped database as JSON lines, CSV, or columns, a chunk of
+rows at a time (so memory use doesn't depend on table size).
+
+Usage:
+
+    python -m srs.export -f csv -o export/
+    python -m srs.export --since 2014-06-01T00:00:00.000000Z -o export/
+
+This writes one file per table in TABLE_TO_KEY_FIELDS (e.g.
+export/rating.csv). Formats are:
+
+jsonl -- one JSON object per row
+csv -- header row, then one line per row (UTF-8)
+columns -- one JSON object per chunk of rows, mapping each column name
+    to a list of values. Much more compact than jsonl for wide tables.
+"""
+from __future__ import absolute_import
+
+import csv
+import json
+import logging
+import sys
+from argparse import ArgumentParser
+from os import makedirs
+from os.path import exists
+from os.path import join
+
+from .db import DEFAULT_DB_NAME
+from .db import TABLE_TO_KEY_FIELDS
+from .db import open_db
+from .db import show_tables
+from .log import log_to_stderr
+
+log = logging.getLogger(__name__)
+
+# number of rows to fetch from sqlite at once
+DEFAULT_CHUNK_SIZE = 1000
+
+FORMAT_TO_EXT = {
+    'columns': '.columns.jsonl',
+    'csv': '.csv',
+    'jsonl': '.jsonl',
+}
+
+
+def export_db(dir_name, format='jsonl', db_name=DEFAULT_DB_NAME,
+              scraper_ids=None, since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Export every table in TABLE_TO_KEY_FIELDS in the given db to files
+    in dir_name (e.g. rating.jsonl).
+
+    format -- one of 'jsonl', 'csv', or 'columns'
+    scraper_ids -- only export rows from these scrapers
+    since -- only export rows from scrapers whose last_scraped is after
+        this ISO datetime (see srs.iso_8601)
+
+    Returns the latest last_scraped of the scrapers exported, to use as
+    since next time. If nothing newer than since was exported, returns
+    since (so it can be passed again), or None if there's no
+    scraper table.
+    """
+    if format not in FORMAT_TO_EXT:
+        raise ValueError('unknown format: {!r}'.format(format))
+
+    db = open_db(db_name, row_factory=None)
+    tables = set(show_tables(db))
+    _check_can_filter_by_since(tables, since)
+
+    if not exists(dir_name):
+        makedirs(dir_name)
+
+    # read the watermark first, so that a scraper that finishes partway
+    # through is exported (again) next time
+    watermark = None
+    if 'scraper' in tables:
+        sql, params = _select_sql('scraper', scraper_ids, since,
+                                  columns='MAX(last_scraped)')
+        watermark = list(db.execute(sql, params))[0][0] or since
+
+    for table in sorted(TABLE_TO_KEY_FIELDS):
+        if table not in tables:
+            continue
+
+        path = join(dir_name, table + FORMAT_TO_EXT[format])
+        with open(path, 'wb') as f:
+            num_rows = export_table(
+                table, f, format=format, db=db, scraper_ids=scraper_ids,
+                since=since, chunk_size=chunk_size)
+
+        log.info('Exported %d rows from `%s` to %s', num_rows, table, path)
+
+    return watermark
+
+
+def export_table(table, f, format='jsonl', db=None, scraper_ids=None,
+                 since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write rows from the given table to the file-like object f,
+    chunk_size rows at a time. See export_db() for the meaning of
+    other arguments.
+
+    Returns the number of rows written.
+    """
+    if db is None:
+        db = open_db(row_factory=None)
+
+    _check_can_filter_by_since(show_tables(db), since)
+
+    sql, params = _select_sql(table, scraper_ids, since)
+    cursor = db.execute(sql, params)
+    columns = [d[0] for d in cursor.description]
+
+    if format == 'csv':
+        writer = csv.writer(f)
+        writer.writerow([c.encode('utf8') for c in columns])
+
+    num_rows = 0
+
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+
+        if format == 'columns':
+            f.write(json.dumps(dict(
+                (c, [row[i] for row in rows]) for i, c in enumerate(columns)
+            ), sort_keys=True) + '\n')
+        elif format == 'csv':
+            writer.writerows([_encode_csv_value(v) for v in row]
+                             for row in rows)
+        else:
+            for row in rows:
+                f.write(json.dumps(dict(zip(columns, row)),
+                                   sort_keys=True) + '\n')
+
+        num_rows += len(rows)
+
+    return num_rows
+
+
+def _check_can_filter_by_since(tables, since):
+    # last_scraped lives in the scraper table
+    if since and 'scraper' not in tables:
+        raise ValueError(
+            "can't filter by last_scraped: db has no scraper table")
+
+
+def _select_sql(table, scraper_ids=None, since=None, columns='*'):
+    """Make SQL and params to select rows from table, filtered by
+    scraper_ids and last_scraped."""
+    sql = 'SELECT {} FROM `{}`'.format(columns, table)
+    where = []
+    params = []
+
+    if scraper_ids:
+        where.append('scraper_id IN ({})'.format(
+            ', '.join('?' for _ in scraper_ids)))
+        params.extend(scraper_ids)
+
+    if since:
+        where.append('scraper_id IN (SELECT scraper_id FROM scraper'
+                     ' WHERE last_scraped > ?)')
+        params.append(since)
+
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+
+    return sql, params
+
+
+def _encode_csv_value(v):
+    # Python 2's csv module only handles bytes
+    if v is None:
+        return ''
+    elif isinstance(v, unicode):
+        return v.encode('utf8')
+    else:
+        return v
+
+
+def main(args=None):
+    parser = ArgumentParser(
+        description='Export the scraped database, one file per table.')
+    parser.add_argument(
+        '-o', '--output', dest='dir_name', default='.',
+        help='Directory to write files to (default: current directory)')
+    parser.add_argument(
+        '-f', '--format', default='jsonl', choices=sorted(FORMAT_TO_EXT),
+        help='Format to write (default: %(default)s)')
+    parser.add_argument(
+        '-d', '--db', dest='db_name', default=DEFAULT_DB_NAME,
+        help='Database to export (default: %(default)s)')
+    parser.add_argument(
+        '-s', '--scraper-id', dest='scraper_ids', action='append',
+        default=None, help='Only export rows from this scraper'
+        ' (may be given more than once)')
+    parser.add_argument(
+        '--since', default=None, metavar='ISO_DATETIME',
+        help='Only export scrapers that ran after this time')
+    parser.add_argument(
+        '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+        help='Rows to fetch at a time (default: %(default)s)')
+    parser.add_argument(
+        '-v', '--verbose', dest='verbose', default=False,
+        action='store_true', help='Enable debug logging')
+    opts = parser.parse_args(args)
+
+    log_to_stderr(verbose=opts.verbose)
+
+    watermark = export_db(
+        opts.dir_name, format=opts.format, db_name=opts.db_name,
+        scraper_ids=opts.scraper_ids, since=opts.since,
+        chunk_size=opts.chunk_size)
+
+    # print the watermark, so scripts can pass it as --since next time
+    if watermark:
+        print watermark
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
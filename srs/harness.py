@@ -2,17 +2,31 @@
 merging, and normalization of records to the harness that runs them."""
 from __future__ import absolute_import
 
+import json
 import logging
 import sys
+import zlib
 from datetime import datetime
 from os import listdir
 from os.path import dirname
+from time import time
 from traceback import print_exc
 from urlparse import urlparse
 
+from .checkpoint import CHECKPOINT_TABLES
+from .checkpoint import clear_checkpoint
+from .checkpoint import is_checkpoint_loaded
+from .checkpoint import load_checkpoint
+from .checkpoint import load_staged_records
+from .checkpoint import reset_checkpoint
+from .checkpoint import stage_records
+from .db import DEFAULT_DB_NAME
 from .db import OBSOLETE_TABLES
 from .db import TABLE_TO_KEY_FIELDS
+from .db import add_columns_if_not_exist
 from .db import create_table_if_not_exists
+from .db import get_field_type
+from .db import normalize_ratings
 from .db import open_db
 from .db import open_dt
 from .db import show_tables
@@ -22,6 +36,11 @@ from .norm import TM_SYMBOLS
 from .norm import clean_string
 from .norm import merge
 from .rating import DEFAULT_MIN_SCORE
+from .stats import get_stats
+from .stats import incr_stat
+from .stats import reset_stats
+from .stats import run_with_cprofile
+from .stats import timed
 
 
 log = logging.getLogger(__name__)
@@ -35,8 +54,12 @@ DEFAULT_SCRAPERS_PACKAGE = 'scrapers'
 
 def run_scrapers(get_records, scraper_ids=None, skip_scraper_ids=None,
                  default_freq=None, scraper_to_freq=None,
-                 scraper_to_last_changed=None, package=None):
-    """Run scrapers.
+                 scraper_to_last_changed=None, package=None,
+                 stats_file=None, profile_scraper_id=None,
+                 profiler=run_with_cprofile, checkpoint_every=None,
+                 shard=None, db_name=None):
+    """Run scrapers, and then normalize all ratings (see
+    srs.db.normalize_ratings()).
 
     get_records -- takes a single argument (a scraper module) and yields
         tuples of (table, row) corresponding to the scraped data.
@@ -49,48 +72,151 @@ def run_scrapers(get_records, scraper_ids=None, skip_scraper_ids=None,
         scraper_id to UTC datetime for when either the code or the data source
         last changed
     package -- package to find scraper modules in (default is 'scrapers')
+    stats_file -- if set, write a line of JSON to this file-like object
+        with the stats for each scraper (they are always stored in the
+        scraper_stats table; see srs.stats)
+    profile_scraper_id -- scraper to run under profiler
+    profiler -- takes scraper_id and a function to call with no
+        arguments. Default is srs.stats.run_with_cprofile
+    checkpoint_every -- if set, stage records every this many records, so
+        that a scraper that crashes can resume where it left off
+        (see srs.checkpoint)
+    shard -- tuple of (shard_index, num_shards). Only run scrapers
+        whose IDs hash to shard_index (see get_shard()). Use srs.merge to
+        combine the databases from each shard.
+    db_name -- database to write to. Default is DEFAULT_DB_NAME, or
+        the shard's database (see get_shard_db_name()) if shard is set
     """
+    if shard:
+        shard_index, num_shards = shard
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(
+                'shard index must be from 0 to num_shards - 1: {!r}'.format(
+                    shard))
+
+    if db_name is None:
+        if shard:
+            db_name = get_shard_db_name(*shard)
+        else:
+            db_name = DEFAULT_DB_NAME
+
+    db = open_db(db_name)
     failed = []
 
-    for scraper_id in (scraper_ids or get_scraper_ids()):
+    all_scraper_ids = get_scraper_ids(package or DEFAULT_SCRAPERS_PACKAGE)
+
+    for scraper_id in (scraper_ids or all_scraper_ids):
+        if shard and get_shard(scraper_id, shard[1]) != shard[0]:
+            continue
+
         if not should_run_scraper(
                 scraper_id, scraper_ids, skip_scraper_ids,
-                default_freq, scraper_to_freq, scraper_to_last_changed):
-            log.info('Skipping scraper: {}'.format(scraper_id))
+                default_freq, scraper_to_freq, scraper_to_last_changed,
+                db=db):
+            log.info('Skipping scraper: %s', scraper_id)
             continue
 
-        log.info('Launching scraper: {}'.format(scraper_id))
-        try:
+        log.info('Launching scraper: %s', scraper_id)
+        reset_stats()
+        reset_checkpoint()
+        start = time()
+
+        def scrape_and_save():
+            # load cursor before get_records(), in case it's not lazy
+            if checkpoint_every:
+                load_checkpoint(scraper_id, db=db)
+
             scraper = load_scraper(scraper_id, package=package)
             records = get_records(scraper)
-            save_records_from_scraper(records, scraper_id)
+            save_records_from_scraper(
+                records, scraper_id, checkpoint_every=checkpoint_every,
+                db_name=db_name)
+
+        try:
+            if scraper_id == profile_scraper_id:
+                profiler(scraper_id, scrape_and_save)
+            else:
+                scrape_and_save()
         except:
             failed.append(scraper_id)
+            incr_stat('failed')
             print_exc()
 
+        incr_stat('total.secs', time() - start)
+        stats = get_stats()
+        save_scraper_stats(scraper_id, stats, db=db)
+        if stats_file is not None:
+            stats_file.write(json.dumps(
+                dict(scraper_id=scraper_id, stats=stats),
+                sort_keys=True) + '\n')
+
+    # one pass over all ratings, rather than normalizing them row by row.
+    # This also fills in rows from before these columns existed, and from
+    # scrapers that didn't run this time
+    normalize_ratings(db=db)
+
     # just calling exit(1) didn't register on morph.io
     if failed:
         raise Exception(
             'failed to scrape campaigns: {}'.format(', '.join(failed)))
 
 
-def delete_records_from_scraper(scraper_id, db=None):
-    """Clear all data from the given scraper."""
+def delete_records_from_scraper(scraper_id, db=None, commit=True):
+    """Clear all data from the given scraper.
+
+    If commit is False, leave that to the caller (so that it can
+    be done in the same transaction as other changes).
+    """
     if db is None:
         db = open_db()
 
     tables = show_tables(db)
 
     for table in tables:
+        if table in CHECKPOINT_TABLES:
+            continue
+
         if table not in set(TABLE_TO_KEY_FIELDS) | set(OBSOLETE_TABLES):
-            log.warn('Unknown table `{}`, not clearing'.format(table))
+            log.warn('Unknown table `%s`, not clearing', table)
             continue
 
-        db.rollback()
+        if commit:
+            db.rollback()
         db.execute(
             'DELETE FROM {} WHERE scraper_id = ?'.format(table),
             [scraper_id])
-        db.commit()
+        if commit:
+            db.commit()
+
+
+def save_scraper_stats(scraper_id, stats, db=None):
+    """Replace the rows in scraper_stats for the given scraper.
+
+    stats -- map from stat name to number (see srs.stats)
+    """
+    if db is None:
+        db = open_db()
+
+    create_table_if_not_exists('scraper_stats', db=db)
+
+    db.rollback()
+    db.execute('DELETE FROM scraper_stats WHERE scraper_id = ?',
+               [scraper_id])
+    db.executemany(
+        'INSERT INTO scraper_stats (scraper_id, stat, value) VALUES (?, ?, ?)',
+        [(scraper_id, k, v) for k, v in sorted(stats.iteritems())])
+    db.commit()
+
+
+def get_shard(scraper_id, num_shards):
+    """Which shard (0 to num_shards - 1) the given scraper belongs to.
+    This is stable across runs and machines."""
+    return (zlib.crc32(scraper_id) & 0xffffffff) % num_shards
+
+
+def get_shard_db_name(shard_index, num_shards, db_name=DEFAULT_DB_NAME):
+    """Name of the db for the given shard (e.g. data-shard-0-of-4)."""
+    return '{}-shard-{}-of-{}'.format(db_name, shard_index, num_shards)
 
 
 def get_scraper_ids(package='scrapers'):
@@ -119,6 +245,9 @@ def add_record(table, record, table_to_key_to_row):
     You will want one table_to_key_to_row per scraper, which you'll
     then store using store_records.
     """
+    # check once, rather than for every row we add
+    debug = log.isEnabledFor(logging.DEBUG)
+
     # recursively add a record, possibly creating other records
     def _add(table, record):
         record = record.copy()
@@ -219,7 +348,8 @@ def add_record(table, record, table_to_key_to_row):
 
         key = tuple(record[k] for k in key_fields)
 
-        log.debug('`{}` {}: {}'.format(table, repr(key), repr(record)))
+        if debug:
+            log.debug('`%s` %r: %r', table, key, record)
 
         table_to_key_to_row.setdefault(table, {})
         key_to_row = table_to_key_to_row[table]
@@ -232,8 +362,24 @@ def add_record(table, record, table_to_key_to_row):
     _add(table, record)
 
 
-def save_records_from_scraper(records, scraper_id):
+def save_records_from_scraper(records, scraper_id, checkpoint_every=None,
+                              db_name=DEFAULT_DB_NAME):
+    """Normalize records from the given scraper, and replace the scraper's
+    existing rows with them in the given db.
+
+    If checkpoint_every is set, flush normalized records to the staging
+    table every checkpoint_every records, and swap them in all at once
+    when records is exhausted (see srs.checkpoint).
+    """
+    db = open_db(db_name)
+
+    if checkpoint_every and not is_checkpoint_loaded(scraper_id):
+        load_checkpoint(scraper_id, db=db)
+
     table_to_key_to_row = {}
+    num_unstaged = 0
+    # stat names for each table, so we don't format them for every record
+    table_to_stat_names = {}
 
     for table, record in records:
         if table not in TABLE_TO_KEY_FIELDS:
@@ -242,38 +388,132 @@ def save_records_from_scraper(records, scraper_id):
                 table = 'campaign_' + table
             else:
                 raise ValueError('unknown table `{}`'.format(table))
+
+        if table not in table_to_stat_names:
+            table_to_stat_names[table] = (
+                'add_record.{}.records'.format(table),
+                'add_record.{}.secs'.format(table))
+        records_stat, secs_stat = table_to_stat_names[table]
+
+        start = time()
         add_record(table, record, table_to_key_to_row)
+        incr_stat(records_stat)
+        incr_stat(secs_stat, time() - start)
+
+        if checkpoint_every:
+            num_unstaged += 1
+            if num_unstaged >= checkpoint_every:
+                with timed('checkpoint.secs'):
+                    stage_records(scraper_id, table_to_key_to_row, db=db)
+                incr_stat('checkpoint.batches')
+                table_to_key_to_row = {}
+                num_unstaged = 0
+
+    if checkpoint_every:
+        # stage the rest, and then read back every batch in order, so that
+        # later records are merged into earlier ones
+        with timed('checkpoint.secs'):
+            stage_records(scraper_id, table_to_key_to_row, db=db)
+            table_to_key_to_row = {}
+            load_staged_records(scraper_id, table_to_key_to_row, db=db)
 
     # add the time this campaign was scraped
     add_record('scraper',
                dict(last_scraped=iso_now()),
                     table_to_key_to_row)
 
-    delete_records_from_scraper(scraper_id)
+    if checkpoint_every:
+        with timed('save.secs'):
+            replace_records_from_scraper(
+                scraper_id, table_to_key_to_row, db_name=db_name)
+        return
+
+    with timed('save.secs'):
+        delete_records_from_scraper(scraper_id, db=db)
+
+        dt = open_dt(db_name)
+
+        for table in table_to_key_to_row:
+            create_table_if_not_exists(table, db=db)
+
+            key_fields = TABLE_TO_KEY_FIELDS[table]
+            if 'scraper_id' not in key_fields:
+                key_fields = ['scraper_id'] + key_fields
+            scraper_id_keys = SCRAPER_ID_KEYS & set(key_fields)
 
-    dt = open_dt()
+            for key, row in table_to_key_to_row[table].iteritems():
+                row = row.copy()
+                for k in scraper_id_keys:
+                    row[k] = scraper_id
 
-    for table in table_to_key_to_row:
-        create_table_if_not_exists(table)
+                dt.upsert(row, table)
+                incr_stat('save.rows')
 
+    # a completed save supersedes any checkpoint left by an earlier run
+    if 'scraper_checkpoint' in show_tables(db):
+        clear_checkpoint(scraper_id, db=db)
+
+
+def replace_records_from_scraper(scraper_id, table_to_key_to_row,
+                                 db_name=DEFAULT_DB_NAME):
+    """Replace all data from the given scraper with the given records (a
+    map from table -> key -> row), and discard its checkpoint, in a single
+    transaction.
+    """
+    # use dumptruck's connection, so that its adapters (e.g. for
+    # lists and dicts) are registered
+    db = open_dt(db_name).connection
+
+    table_to_rows = {}
+    for table, key_to_row in table_to_key_to_row.iteritems():
         key_fields = TABLE_TO_KEY_FIELDS[table]
         if 'scraper_id' not in key_fields:
             key_fields = ['scraper_id'] + key_fields
         scraper_id_keys = SCRAPER_ID_KEYS & set(key_fields)
 
-        for key, row in table_to_key_to_row[table].iteritems():
-            row = row.copy()
+        rows = []
+        for row in key_to_row.itervalues():
+            row = dict((k, v) for k, v in row.iteritems() if v is not None)
             for k in scraper_id_keys:
                 row[k] = scraper_id
+            rows.append(row)
+
+        table_to_rows[table] = rows
+
+    # sqlite3 commits before schema changes, so make them all up front
+    for table, rows in table_to_rows.iteritems():
+        create_table_if_not_exists(table, db=db)
+        add_columns_if_not_exist(
+            table, ((k, get_field_type(v))
+                    for row in rows for k, v in row.iteritems()), db=db)
+    db.commit()
+
+    try:
+        delete_records_from_scraper(scraper_id, db=db, commit=False)
+
+        for table, rows in table_to_rows.iteritems():
+            for row in rows:
+                keys = sorted(row)
+                db.execute(
+                    'INSERT OR REPLACE INTO `{}` ({}) VALUES ({})'.format(
+                        table, ', '.join('`{}`'.format(k) for k in keys),
+                        ', '.join('?' for k in keys)),
+                    [row[k] for k in keys])
+                incr_stat('save.rows')
+
+        clear_checkpoint(scraper_id, db=db, commit=False)
+    except:
+        db.rollback()
+        raise
 
-            dt.upsert(row, table)
+    db.commit()
 
 
 def get_last_scraped(scraper_id, db=None):
     if db is None:
         db = open_db()
 
-    create_table_if_not_exists('scraper')
+    create_table_if_not_exists('scraper', db=db)
     sql = 'SELECT last_scraped FROM scraper where scraper_id = ?'
 
     rows = list(db.execute(sql, [scraper_id]))
@@ -286,7 +526,7 @@ def get_last_scraped(scraper_id, db=None):
 
 def should_run_scraper(
         scraper_id, scraper_ids, skip_scraper_ids,
-        default_freq, scraper_to_freq, scraper_to_last_changed):
+        default_freq, scraper_to_freq, scraper_to_last_changed, db=None):
 
     # whitelist takes precedence
     if scraper_ids:
@@ -301,7 +541,7 @@ def should_run_scraper(
     if freq is None:
         return True
 
-    last_scraped = get_last_scraped(scraper_id)
+    last_scraped = get_last_scraped(scraper_id, db=db)
     if last_scraped is None:
         return True
 
@@ -1,21 +1,117 @@
 """Utilities for setting up logging."""
 from __future__ import absolute_import
 
+import atexit
+import json
 import logging
+import threading
 from os import environ
+from Queue import Queue
 
 DEFAULT_FORMAT = '%(name)s: %(message)s'
 
 
-def log_to_stderr(verbose=False, quiet=False, format=DEFAULT_FORMAT):
-    """Set up logging to stderr."""
+def log_to_stderr(verbose=False, quiet=False, format=DEFAULT_FORMAT,
+                  structured=False, queued=False):
+    """Set up logging to stderr.
+
+    structured -- log one JSON object per line instead of using format
+    queued -- write to stderr from a background thread, so that logging
+        never blocks scraping (always on if structured is set)
+    """
     level = logging.INFO
     if verbose or environ.get('MORPH_VERBOSE'):
         level = logging.DEBUG
     elif quiet:
         level = logging.WARN
 
-    logging.basicConfig(format=format, level=level)
+    if structured or queued:
+        root = logging.getLogger()
+        # like basicConfig(), don't clobber existing configuration
+        if not root.handlers:
+            handler = logging.StreamHandler()
+            if structured:
+                handler.setFormatter(JSONFormatter())
+            else:
+                handler.setFormatter(logging.Formatter(format))
+
+            root.addHandler(QueueHandler(start_queue_listener(handler)))
+            root.setLevel(level)
+    else:
+        logging.basicConfig(format=format, level=level)
+
     if not verbose:
         logging.getLogger('requests.packages.urllib3.connectionpool').setLevel(
             logging.WARN)
+
+
+class JSONFormatter(logging.Formatter):
+    """Format log records as a line of JSON, with time, level, name,
+    message, and exc_info (traceback) if any."""
+
+    def format(self, record):
+        d = dict(
+            time=record.created,
+            level=record.levelname,
+            name=record.name,
+            message=record.getMessage(),
+        )
+        if record.exc_info:
+            d['exc_info'] = self.formatException(record.exc_info)
+        elif getattr(record, 'exc_text', None):
+            d['exc_info'] = record.exc_text
+
+        return json.dumps(d, sort_keys=True)
+
+
+class QueueHandler(logging.Handler):
+    """Put log records on a queue, to be handled in another thread
+    (like logging.handlers.QueueHandler in Python 3)."""
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+
+    def prepare(self, record):
+        """Render the message and traceback now, since args may change
+        (or not be picklable) by the time the record is handled."""
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+
+def start_queue_listener(handler):
+    """Start a daemon thread that passes records from a new queue to
+    handler, and return the queue. Remaining records are handled when
+    the interpreter exits."""
+    queue = Queue()
+
+    def listen():
+        while True:
+            record = queue.get()
+            if record is None:
+                break
+            handler.handle(record)
+
+    thread = threading.Thread(target=listen, name='srs-log')
+    thread.daemon = True
+    thread.start()
+
+    def stop():
+        queue.put(None)
+        thread.join()
+        handler.flush()
+
+    atexit.register(stop)
+
+    return queue
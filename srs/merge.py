@@ -0,0 +1,159 @@
+"""Merge databases from sharded runs (see the shard argument to
+run_scrapers()) into the main database.
+
+Usage:
+
+    python -m srs.merge data-shard-0-of-2 data-shard-1-of-2
+
+For each scraper that finished in a shard (i.e. has a row in the shard's
+scraper table), all of its rows in the main database are replaced with
+the rows from the shard. Each shard is merged in a single transaction.
+"""
+from __future__ import absolute_import
+
+import logging
+import sys
+from argparse import ArgumentParser
+from os.path import exists
+
+from .db import DEFAULT_DB_NAME
+from .db import TABLE_TO_KEY_FIELDS
+from .db import add_columns_if_not_exist
+from .db import create_table_if_not_exists
+from .db import get_db_path
+from .db import open_db
+from .db import show_tables
+from .log import log_to_stderr
+
+log = logging.getLogger(__name__)
+
+# name to ATTACH shard databases as
+SHARD_SCHEMA = 'shard'
+
+
+def merge_dbs(src_db_names, dst_db_name=DEFAULT_DB_NAME):
+    """Merge each of the given dbs into dst_db_name, replacing data from
+    any scraper that finished in the source db."""
+    db = open_db(dst_db_name)
+
+    for src_db_name in src_db_names:
+        merge_db(src_db_name, db=db)
+
+
+def merge_db(src_db_name, db=None):
+    """Merge src_db_name into the given db (by default, the main db).
+
+    Returns the IDs of the scrapers merged.
+    """
+    if db is None:
+        db = open_db()
+
+    # ATTACH would silently create an empty db
+    src_db_path = get_db_path(src_db_name)
+    if not exists(src_db_path):
+        raise IOError('no such db: {}'.format(src_db_path))
+
+    log.info('Merging %s', src_db_name)
+
+    # sqlite3 commits before ATTACH and schema changes, so do them
+    # before touching any data
+    db.commit()
+    db.execute('ATTACH DATABASE ? AS {}'.format(SHARD_SCHEMA),
+               [src_db_path])
+
+    try:
+        src_tables = set(show_tables_in_schema(db, SHARD_SCHEMA))
+        tables = [t for t in sorted(TABLE_TO_KEY_FIELDS) if t in src_tables]
+
+        if 'scraper' not in src_tables:
+            log.warn('No scraper table in %s, nothing to merge', src_db_name)
+            return []
+
+        scraper_ids = [row[0] for row in db.execute(
+            'SELECT scraper_id FROM {}.scraper'.format(SHARD_SCHEMA))]
+
+        table_to_columns = {}
+        for table in tables:
+            create_table_if_not_exists(table, db=db)
+            fields = get_fields_in_schema(db, table, SHARD_SCHEMA)
+            add_columns_if_not_exist(table, fields, db=db)
+            table_to_columns[table] = [k for k, _ in fields]
+        db.commit()
+
+        try:
+            merge_rows(db, tables, table_to_columns, scraper_ids)
+        except:
+            db.rollback()
+            raise
+
+        db.commit()
+    finally:
+        db.execute('DETACH DATABASE {}'.format(SHARD_SCHEMA))
+
+    log.info('Merged %d scrapers from %s: %s',
+             len(scraper_ids), src_db_name, ', '.join(scraper_ids))
+
+    return scraper_ids
+
+
+def merge_rows(db, tables, table_to_columns, scraper_ids):
+    """Replace rows from the given scrapers in the main db with rows from the
+    attached shard db. Doesn't commit."""
+    # delete from every table, not just the ones in the shard
+    for table in show_tables(db):
+        if table in TABLE_TO_KEY_FIELDS:
+            db.executemany(
+                'DELETE FROM main.`{}` WHERE scraper_id = ?'.format(table),
+                [(scraper_id,) for scraper_id in scraper_ids])
+
+    for table in tables:
+        columns = ', '.join('`{}`'.format(c) for c in table_to_columns[table])
+
+        cursor = db.execute(
+            'INSERT OR REPLACE INTO main.`{table}` ({columns})'
+            ' SELECT {columns} FROM {schema}.`{table}`'
+            ' WHERE scraper_id IN (SELECT scraper_id FROM {schema}.scraper)'
+            .format(table=table, columns=columns, schema=SHARD_SCHEMA))
+
+        log.debug('%s: %d rows', table, cursor.rowcount)
+
+
+def show_tables_in_schema(db, schema):
+    """List the tables in the given attached db."""
+    sql = "SELECT name FROM {}.sqlite_master WHERE type = 'table'".format(
+        schema)
+    return sorted(row[0] for row in db.execute(sql))
+
+
+def get_fields_in_schema(db, table, schema):
+    """Get (column, type) pairs for the given table in the given
+    attached db."""
+    return [(row[1], row[2]) for row in db.execute(
+        'PRAGMA {}.table_info(`{}`)'.format(schema, table))]
+
+
+def main(args=None):
+    parser = ArgumentParser(
+        description='Merge shard databases into the main database.')
+    parser.add_argument(
+        'src_db_names', nargs='+', metavar='SHARD_DB',
+        help='Shard databases to merge (e.g. data-shard-0-of-2)')
+    parser.add_argument(
+        '-o', '--output', dest='dst_db_name', default=DEFAULT_DB_NAME,
+        help='Database to merge into (default: %(default)s)')
+    parser.add_argument(
+        '-v', '--verbose', dest='verbose', default=False,
+        action='store_true', help='Enable debug logging')
+    opts = parser.parse_args(args)
+
+    log_to_stderr(verbose=opts.verbose)
+
+    # allow db names to be given as paths
+    src_db_names = [n[:-len('.sqlite')] if n.endswith('.sqlite') else n
+                    for n in opts.src_db_names]
+
+    merge_dbs(src_db_names, opts.dst_db_name)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
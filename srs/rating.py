@@ -11,4 +11,5 @@ def grade_to_judgment(grade):
     This works for Free2Work and Rank a Brand, anyways. In theory, campaigns
     could color their grades differently.
     """
-    return cmp('C', grade[0].upper())
+    letter = grade[0].upper()
+    return ('C' > letter) - ('C' < letter)
@@ -13,6 +13,8 @@ from urllib2 import URLError
 
 from bs4 import BeautifulSoup
 
+from .stats import incr_stat
+from .stats import timed
 from .vendor.reppy.cache import RobotsCache
 
 DEFAULT_HEADERS = {
@@ -68,19 +70,25 @@ def scrape(url, headers=DEFAULT_HEADERS, timeout=DEFAULT_TIMEOUT,
         headers=DEFAULT_HEADERS
 
     if not ignore_robots_txt:
-        user_agent = headers.get('User-Agent', '')
+        with timed('scrape.robots_secs'):
+            user_agent = headers.get('User-Agent', '')
 
-        if not ROBOTS.allowed(url, user_agent):
-            raise DisallowedByRobotsTxtError()
+            if not ROBOTS.allowed(url, user_agent):
+                raise DisallowedByRobotsTxtError()
 
-        crawl_delay = ROBOTS.delay(url, user_agent)
-        if crawl_delay:
-            log.debug('sleeping for {:.1f} seconds (crawl-delay)'.format(
-                crawl_delay))
-            sleep(crawl_delay)
+            crawl_delay = ROBOTS.delay(url, user_agent)
+            if crawl_delay:
+                log.debug('sleeping for %.1f seconds (crawl-delay)',
+                          crawl_delay)
+                sleep(crawl_delay)
 
-    return urlopen(
-        Request(url, headers=headers), data=data, timeout=timeout).read()
+    incr_stat('scrape.requests')
+    with timed('scrape.secs'):
+        content = urlopen(
+            Request(url, headers=headers), data=data, timeout=timeout).read()
+    incr_stat('scrape.bytes', len(content))
+
+    return content
 
 
 def scrape_json(url, **kwargs):
@@ -0,0 +1,83 @@
+"""Counters and timers for finding out where scrapers spend their time.
+
+Stats are kept for one scraper at a time (the harness calls reset_stats()
+before launching each scraper), as a map from stat name to number.
+
+Stat names are dotted, e.g.:
+
+scrape.requests -- number of calls to scrape()
+scrape.bytes -- bytes downloaded by scrape()
+scrape.secs -- time spent waiting on HTTP
+scrape.robots_secs -- time spent checking robots.txt and sleeping for
+    crawl-delay
+add_record.<table>.records -- records passed to add_record() for <table>
+add_record.<table>.secs -- time spent in add_record() for <table>
+add_record.<table>.records_per_sec -- filled in by get_stats()
+save.rows -- rows written to the db
+save.secs -- time spent writing rows to the db
+checkpoint.batches -- batches of records flushed to the staging table
+checkpoint.secs -- time spent staging records and reading them back
+total.secs -- time spent running the scraper, start to finish
+failed -- 1 if the scraper raised an exception
+"""
+from __future__ import absolute_import
+
+import cProfile
+import logging
+from contextlib import contextmanager
+from time import time
+
+log = logging.getLogger(__name__)
+
+# stats for the scraper currently running
+_stats = {}
+
+
+def reset_stats():
+    """Clear all stats (call this before running a new scraper)."""
+    _stats.clear()
+
+
+def get_stats():
+    """Return a copy of the current stats, with records/sec for each
+    table filled in."""
+    stats = dict(_stats)
+
+    for name, value in _stats.iteritems():
+        if name.startswith('add_record.') and name.endswith('.records'):
+            prefix = name[:-len('records')]
+            secs = _stats.get(prefix + 'secs')
+            if secs:
+                stats[prefix + 'records_per_sec'] = value / secs
+
+    return stats
+
+
+def incr_stat(name, amount=1):
+    """Add amount (default 1) to the given stat."""
+    _stats[name] = _stats.get(name, 0) + amount
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the with block (in seconds) to the
+    given stat."""
+    start = time()
+    try:
+        yield
+    finally:
+        incr_stat(name, time() - start)
+
+
+def run_with_cprofile(scraper_id, func):
+    """Run func() under cProfile, dumping stats to <scraper_id>.prof.
+
+    Suitable as the profiler argument to run_scrapers().
+    """
+    path = scraper_id + '.prof'
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        profiler.dump_stats(path)
+        log.info('Wrote profile for %s to %s', scraper_id, path)